@@ -1,29 +1,156 @@
-import argparse
+# argparse, concurrent.futures, hashlib and tempfile are imported in the
+# functions that need them: together they are most of this module's import time
+import errno
 import os
+import re
 import subprocess
 import json
+import selectors
 import shutil
 import sys
-from concurrent.futures import ThreadPoolExecutor
-import multiprocessing
-import tempfile
+import threading
+import time
 
-def download_music(playlist_url, output_dir, log_file, user, password, pref_format):
+try:
+    # Comes with beets in the add-on image; only used to schedule long tracks first
+    import mutagen
+except ImportError:
+    mutagen = None
+
+def usable_cpus():
+    """
+    CPUs this process may actually use. os.cpu_count() reports the host's CPUs,
+    but an add-on container can be pinned to fewer (affinity) or throttled to
+    fewer (cgroup CPU quota).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # cgroup v2 exposes "<quota> <period>" (or "max <period>"), v1 two separate files
+    quota = period = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = f.read().strip()
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+    try:
+        if quota not in (None, "max", "-1"):
+            # Round up: a 1.5 CPU quota can still keep two workers busy
+            cpus = min(cpus, -(-int(quota) // int(period)))
+    except (ValueError, ZeroDivisionError):
+        pass
+    return max(1, cpus)
+
+# Constant for the life of the process; looked up once instead of per call site
+CPU_COUNT = usable_cpus()
+
+# Bytes to pull from a child's stdout per read
+READ_CHUNK_SIZE = 65536
+
+# Write buffer for download_log.txt; short drains pile up here instead of each costing a write()
+LOG_BUFFER_SIZE = 65536
+
+# sldl output lines worth showing on the console, matched on the raw bytes in one scan
+SLDL_KEYWORDS_RE = re.compile(rb"Downloading|tracks:|Succeeded:|Failed:|Completed:|Not found:|All downloads failed:")
+# Keywords that, at the start of a line, name a track which couldn't be downloaded
+SLDL_FAILURE_KEYWORDS = frozenset({b"Not found:", b"All downloads failed:"})
+
+# beet import lines shown on the console: one scan over the log finds them, then the
+# first matching class (in this order) picks the prefix
+BEETS_LINES_RE = re.compile(r"^.*(?:tagging|found|fetching|art|error|album|track|match).*$",
+                            re.IGNORECASE | re.MULTILINE)
+BEETS_LINE_STYLES = (
+    (re.compile(r"tagging|found", re.IGNORECASE), "📋 "),
+    (re.compile(r"fetching|art", re.IGNORECASE), "🖼️ "),
+    (re.compile(r"error", re.IGNORECASE), "⚠️ "),
+    (re.compile(r"album|track|match", re.IGNORECASE), ""),
+)
+
+# Two-pass loudness normalization settings (EBU R128)
+TARGET_LUFS = "-14"
+TRUE_PEAK = "-1.5"
+TARGET_LRA = "11"
+LOUDNORM_TARGET = f"I={TARGET_LUFS}:TP={TRUE_PEAK}:LRA={TARGET_LRA}"
+
+# Audio file extensions picked up for normalization
+SUPPORTED_EXTENSIONS = frozenset({'.flac', '.mp3', '.ogg', '.wav', '.aiff'})
+
+# Tracks measured within this many LU of the target (and under the true-peak ceiling)
+# skip loudnorm: MP3s are kept as-is, anything else is just transcoded
+SKIP_TOLERANCE_LU = 1.0
+
+# Sidecar in the output directory remembering, per source file, its loudnorm analysis
+# and the size/mtime of the MP3 it produced, so re-runs can skip work already done
+LOUDNESS_CACHE_FILE = ".soulsleek_lufs.json"
+
+# Leading bytes hashed (with the file size) to spot the same track downloaded twice
+DEDUP_HASH_BYTES = 1 << 20
+
+# Rough bytes per second of audio, used to guess durations mutagen can't read
+FALLBACK_BYTES_PER_SECOND = 40000
+
+# Threads unlinking files when the downloads folder is cleaned up
+CLEANUP_WORKERS = 16
+
+# Seconds between scans of the download directory while sldl is still running
+WATCH_INTERVAL = 5
+
+# Kill an ffmpeg pass that runs longer than this (seconds) so one bad file can't stall the batch
+# (SOULSLEEK_NORMALIZE_TIMEOUT; an unparsable value falls back to the default like SOULSLEEK_JOBS)
+try:
+    NORMALIZE_TIMEOUT = max(1, int(os.environ.get("SOULSLEEK_NORMALIZE_TIMEOUT", "1800")))
+except ValueError:
+    NORMALIZE_TIMEOUT = 1800
+
+# RAM-backed directory ffmpeg encodes into before the MP3 is moved to the output dir
+STAGING_ROOT = "/dev/shm"
+# Free space to require in STAGING_ROOT, as a multiple of the source size: a 320 kbps
+# encode of a low-bitrate source can be ~2.5x larger, and other workers share the space
+STAGING_HEADROOM = 4
+
+# Sonos-friendly output: 320 kbps MP3 at 44.1 kHz
+ENCODE_ARGS = ("-c:a", "libmp3lame", "-ar", "44100", "-b:a", "320k")
+
+# loudnorm's JSON report fields fed back into the second pass
+LOUDNORM_FIELDS = ("input_i", "input_tp", "input_lra", "input_thresh", "target_offset")
+
+def download_music(playlist_urls, output_dir, log_file, user, password, pref_format):
     """
     Downloads music from Soulseek using slsk-batchdl and logs the output.
+    Several playlists are fetched by a single sldl run so login and startup happen once.
     Returns tuple of (success, failed_tracks_list)
     """
+    import tempfile
+
     # Verify sldl binary exists
     if not os.path.exists("/usr/local/bin/sldl"):
         print("❌ sldl binary not found", flush=True)
         return False, []
     
-    print(f"Downloading music from {playlist_url} to {output_dir}", flush=True)
+    print(f"Downloading music from {', '.join(playlist_urls)} to {output_dir}", flush=True)
     # Use multiple concurrent downloads for sldl
-    max_concurrent = min(4, multiprocessing.cpu_count())
+    max_concurrent = min(4, CPU_COUNT)
+    
+    # More than one playlist goes through sldl's list input: one source per line
+    list_file = None
+    if len(playlist_urls) == 1:
+        source = [playlist_urls[0]]
+    else:
+        with tempfile.NamedTemporaryFile('w', prefix="sldl_", suffix=".txt", delete=False) as f:
+            f.write('\n'.join(f'"{url}"' for url in playlist_urls) + '\n')
+            list_file = f.name
+        source = [list_file, "--input-type", "list"]
     
     command = [
-        "/usr/local/bin/sldl", playlist_url,
+        "/usr/local/bin/sldl", *source,
         "-p", output_dir,
         "--user", user,
         "--pass", password,
@@ -34,29 +161,74 @@ def download_music(playlist_url, output_dir, log_file, user, password, pref_form
     failed_tracks = []
     
     try:
-        print(f"🎵 Starting download from Spotify playlist...", flush=True)
+        print(f"🎵 Starting download of {len(playlist_urls)} Spotify playlist(s)...", flush=True)
         
         # Run process and capture essential output only
-        with open(log_file, 'w') as f:
-            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                                     universal_newlines=True, bufsize=0)
+        with open(log_file, 'wb', buffering=LOG_BUFFER_SIZE) as f:
+            # Unbuffered on purpose: the pipe fd is read directly below, and a buffered
+            # reader could hold data the selector never reports as readable
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=0)
             
-            for line in process.stdout:
-                line = line.rstrip()
-                f.write(line + '\n')
-                f.flush()
-                
-                # Track failed downloads - check for various failure patterns
-                if line.startswith("Not found: ") or line.startswith("All downloads failed: "):
-                    # Extract track info from failed download line
-                    track_name = line.replace("Not found: ", "").replace("All downloads failed: ", "")
-                    failed_tracks.append(track_name)
-                
-                # Only show essential download progress
-                if any(keyword in line for keyword in [
-                    'Downloading', 'tracks:', 'Succeeded:', 'Failed:', 'Completed:', 'Not found:', 'All downloads failed:'
-                ]):
-                    print(line, flush=True)
+            # Drain sldl's output in large non-blocking reads and handle it a chunk at a time,
+            # instead of a Python round trip (and log flush) for every line. The log gets the
+            # raw bytes as read; only the console filter decodes anything.
+            fd = process.stdout.fileno()
+            os.set_blocking(fd, False)
+            # One read buffer reused for every read, and one growing buffer of output not yet
+            # scanned; only a trailing partial line survives from one drain to the next
+            read_buffer = bytearray(READ_CHUNK_SIZE)
+            read_view = memoryview(read_buffer)
+            data = bytearray()
+            eof = False
+            with selectors.DefaultSelector() as selector:
+                selector.register(fd, selectors.EVENT_READ)
+                while not eof:
+                    selector.select()
+                    start = len(data)
+                    while True:
+                        try:
+                            n = os.readv(fd, (read_buffer,))
+                        except BlockingIOError:
+                            break
+                        if not n:
+                            eof = True
+                            break
+                        data += read_view[:n]
+                    with memoryview(data) as drained:
+                        f.write(drained[start:])
+                    
+                    # Scan complete lines only, unless the child is gone. Like the text-mode
+                    # reader this replaced, a bare \r (sldl's progress updates) ends a line too
+                    end = len(data) if eof else max(data.rfind(b'\n'), data.rfind(b'\r')) + 1
+                    if not end:
+                        continue
+                    
+                    # Most lines are progress noise: search the whole drain for keywords and
+                    # only cut out (and decode) the lines they fall in
+                    handled = 0
+                    for keyword in SLDL_KEYWORDS_RE.finditer(data, 0, end):
+                        if keyword.start() < handled:
+                            continue
+                        line_start = max(data.rfind(b'\n', 0, keyword.start()),
+                                         data.rfind(b'\r', 0, keyword.start())) + 1
+                        line_end = data.find(b'\n', keyword.end(), end)
+                        carriage_return = data.find(b'\r', keyword.end(), end)
+                        if line_end == -1 or -1 < carriage_return < line_end:
+                            line_end = carriage_return
+                        if line_end == -1:
+                            line_end = end
+                        handled = line_end
+                        line = data[line_start:line_end].decode('utf-8', errors='replace').rstrip()
+                        
+                        # Track failed downloads: the keyword match already says whether
+                        # this line starts with a failure prefix, no second scan needed
+                        if keyword.start() == line_start and keyword.group() in SLDL_FAILURE_KEYWORDS:
+                            # Extract track info from failed download line
+                            failed_tracks.append(line[len(keyword.group()):].strip())
+                        
+                        # Only show essential download progress
+                        print(line, flush=True)
+                    del data[:end]
             
             process.wait()
         
@@ -80,75 +252,329 @@ def download_music(playlist_url, output_dir, log_file, user, password, pref_form
         with open(log_file, 'a') as f:
             f.write(f"\n\nError: {e}")
         return False, failed_tracks
+    finally:
+        if list_file:
+            os.remove(list_file)
 
-def normalize_single_file(file_path, normalize_script_path, converted_dir):
+def measure_loudness(file_path, ffmpeg="ffmpeg"):
     """
-    Normalize a single audio file.
+    Run the loudnorm analysis pass and return the measured values.
+    Returns None if ffmpeg fails or the report can't be parsed.
     """
+    # Audio only: embedded cover art would otherwise be decoded and pushed through the null muxer too
+    command = [
+        ffmpeg, "-hide_banner", "-nostats", "-i", file_path,
+        "-vn", "-sn", "-dn",
+        "-af", f"loudnorm={LOUDNORM_TARGET}:print_format=json",
+        "-f", "null", "-"
+    ]
+    process = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, timeout=NORMALIZE_TIMEOUT)
+    if process.returncode != 0:
+        return None
+
+    # The JSON report is loudnorm's last brace-delimited block; newer ffmpeg still
+    # prints the muxer summary and a final size=/time= line after it
     try:
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        output_file = os.path.join(converted_dir, f"{base_name}.mp3")
-        
-        print(f"🎧 Processing: {os.path.basename(file_path)}", flush=True)
+        report = json.JSONDecoder().raw_decode(process.stderr, process.stderr.rindex("{"))[0]
+        return {key: report[key] for key in LOUDNORM_FIELDS}
+    except (ValueError, KeyError):
+        return None
 
-        command = ["bash", normalize_script_path, file_path, output_file]
-        
-        # Run normalization with minimal output
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                                 universal_newlines=True, bufsize=0)
-        
-        # Capture loudness values but don't show FFmpeg details
-        loudness_info = {}
-        for line in process.stdout:
-            line = line.rstrip()
-            if "Measured I:" in line:
-                loudness_info['input'] = line.split(':')[1].strip()
-            elif "Target Offset:" in line:
-                loudness_info['offset'] = line.split(':')[1].strip()
-            elif "Normalization complete" in line:
-                if loudness_info:
-                    print(f"   📊 Input: {loudness_info.get('input', 'N/A')} LUFS → Target: -14 LUFS", flush=True)
+def fast_place(src, dst):
+    """
+    Put a copy of src at dst as cheaply as the filesystems allow: a hard link
+    when both are on the same filesystem, an in-kernel copy_file_range across
+    filesystems, and a plain copy everywhere else.
+    """
+    try:
+        if os.path.lexists(dst):
+            os.remove(dst)
+        os.link(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV or not hasattr(os, "copy_file_range"):
+            shutil.copyfile(src, dst)
+            return
+
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+            if remaining > 0:
+                raise OSError(errno.EIO, "copy_file_range stopped early", src)
+    except OSError:
+        # Older kernels refuse some cross-filesystem pairs
+        shutil.copyfile(src, dst)
+
+def content_fingerprint(file_path):
+    """
+    Cheap identity for a download: its size plus a hash of its first MiB.
+    Two sources resolving to the same encode give the same fingerprint.
+    """
+    import hashlib
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        digest.update(str(os.fstat(f.fileno()).st_size).encode())
+        digest.update(f.read(DEDUP_HASH_BYTES))
+    return digest.hexdigest()
+
+def make_staging_dir():
+    """
+    Private scratch directory under STAGING_ROOT, or None if there is none.
+    """
+    import tempfile
+
+    if not os.path.isdir(STAGING_ROOT):
+        return None
+    try:
+        return tempfile.mkdtemp(prefix="soulsleek-", dir=STAGING_ROOT)
+    except OSError:
+        return None
+
+def staging_has_room(staging_dir, file_path):
+    """
+    Check that staging_dir can take the encode of file_path. Docker's default
+    /dev/shm is only 64 MB, so this is checked per file rather than once.
+    """
+    try:
+        stat = os.statvfs(staging_dir)
+        return stat.f_bavail * stat.f_frsize >= STAGING_HEADROOM * os.path.getsize(file_path)
+    except OSError:
+        return False
+
+def converted_name(name):
+    """
+    File name of the normalized MP3 for a source file named name.
+    """
+    return f"{os.path.splitext(name)[0]}.mp3"
+
+def converted_path(file_path, converted_dir):
+    """
+    Where the normalized MP3 for file_path is written.
+    """
+    return os.path.join(converted_dir, converted_name(os.path.basename(file_path)))
+
+def loudness_cache_key(file_path):
+    """
+    Cache key for a source file: a re-downloaded copy keeps its name and size.
+    """
+    return f"{os.path.basename(file_path)}:{os.path.getsize(file_path)}"
+
+def load_loudness_cache(converted_dir):
+    """
+    Load the cache of {"measured": ..., "output": [size, mtime_ns]} entries,
+    or an empty cache if there is none.
+    """
+    try:
+        with open(os.path.join(converted_dir, LOUDNESS_CACHE_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_loudness_cache(converted_dir, cache):
+    """
+    Persist loudnorm measurements next to the converted files.
+    """
+    try:
+        with open(os.path.join(converted_dir, LOUDNESS_CACHE_FILE), 'w') as f:
+            json.dump(cache, f)
+    except OSError as e:
+        print(f"⚠️ Could not save loudness cache: {e}", flush=True)
+
+def parse_progress(output):
+    """
+    Fold ffmpeg's -progress key=value stream into a dict of the latest values.
+    """
+    state = {}
+    for line in output.splitlines():
+        key, _, value = line.partition('=')
+        state[key.strip()] = value.strip()
+    return state
+
+def format_duration(seconds):
+    """
+    Format seconds as m:ss for the log.
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
+def is_already_normalized(measured):
+    """
+    Whether measured loudness is close enough to the target that applying
+    loudnorm would change nothing audible.
+    """
+    return (abs(float(measured['input_i']) - float(TARGET_LUFS)) < SKIP_TOLERANCE_LU
+            and float(measured['input_tp']) <= float(TRUE_PEAK))
+
+def encode_mp3(file_path, output_file, audio_filter, ffmpeg="ffmpeg"):
+    """
+    Encode file_path to output_file with the given -af arguments.
+    Returns the finished process and its parsed -progress report.
+    """
+    # -progress gives a stable key=value status on stdout instead of free-form stderr
+    command = [
+        ffmpeg, "-hide_banner", "-nostats", "-loglevel", "error", "-progress", "pipe:1",
+        "-i", file_path, *audio_filter, *ENCODE_ARGS,
+        output_file, "-y"
+    ]
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=True, timeout=NORMALIZE_TIMEOUT)
+    return process, parse_progress(process.stdout)
+
+def encode_succeeded(process, progress):
+    """
+    Check that an encode_mp3() run exited cleanly and got to the end of the input.
+    """
+    return process.returncode == 0 and progress.get("progress") == "end"
+
+def normalize_single_file(file_path, converted_dir, ffmpeg="ffmpeg", cached=None, fast=False,
+                          staging_dir=None):
+    """
+    Normalize a single audio file with a two-pass ffmpeg loudnorm, reading the
+    source and writing the MP3 in one ffmpeg run without intermediate files.
+    ffmpeg is the resolved binary path, so the PATH lookup isn't repeated per file.
+    cached is this source's loudness cache entry: if the MP3 it produced last
+    time is still there untouched the file is skipped outright, otherwise the
+    cached analysis replaces the first pass.
+    fast skips the analysis pass for uncached files and normalizes in one
+    dynamic loudnorm pass, trading a little accuracy for roughly half the CPU.
+    staging_dir, if given and roomy enough, is where ffmpeg writes the MP3; the
+    finished file is then moved into converted_dir in one sequential copy. An
+    encode that runs out of space there is redone directly in converted_dir.
+    """
+    encode_file = None
+    try:
+        # One basename for the whole call; the naming rule itself stays in converted_name()
+        name = os.path.basename(file_path)
+        output_name = converted_name(name)
+        output_file = os.path.join(converted_dir, output_name)
         
-        process.wait()
+        print(f"🎧 Processing: {name}", flush=True)
+
+        cached = cached or {}
+        # Same source as a previous run and its output unchanged since: nothing to redo
+        if cached.get("output"):
+            try:
+                stat = os.stat(output_file)
+                if [stat.st_size, stat.st_mtime_ns] == cached["output"]:
+                    print(f"   ⏭️ Unchanged since last run, skipping: {output_name}", flush=True)
+                    return {"status": "success", "file": file_path, "output": output_file,
+                            "measured": cached.get("measured"), "unchanged": True}
+            except OSError:
+                pass
+
+        measured = cached.get("measured")
+        if measured is None and not fast:
+            measured = measure_loudness(file_path, ffmpeg)
+            if measured is None:
+                return {"status": "failed", "file": file_path, "error": "Loudness analysis failed"}
+
+        on_target = measured is not None and is_already_normalized(measured)
+
+        # Already-loud-enough MP3s don't need a lossy re-encode, just put them in place
+        if on_target and name.lower().endswith(".mp3"):
+            fast_place(file_path, output_file)
+            print(f"   ⏭️ Already at {measured['input_i']} LUFS, kept as-is: {output_name}", flush=True)
+            return {"status": "success", "file": file_path, "output": output_file, "measured": measured}
+
+        if on_target:
+            # Other formats still need the MP3 transcode, but not loudnorm's DSP (and its
+            # internal 192 kHz resample), which would only apply a fraction of a dB
+            audio_filter = []
+        elif measured:
+            loudnorm = (
+                f"loudnorm={LOUDNORM_TARGET}"
+                f":measured_I={measured['input_i']}:measured_LRA={measured['input_lra']}"
+                f":measured_TP={measured['input_tp']}:measured_thresh={measured['input_thresh']}"
+                f":offset={measured['target_offset']}:linear=true"
+            )
+            audio_filter = ["-af", loudnorm]
+        else:
+            audio_filter = ["-af", f"loudnorm={LOUDNORM_TARGET}"]
+        # Encoding in RAM keeps ffmpeg's small scattered writes off the (often SD card)
+        # output disk, which may also be busy taking sldl's downloads
+        if staging_dir and staging_has_room(staging_dir, file_path):
+            encode_file = os.path.join(staging_dir, output_name)
+        else:
+            encode_file = output_file
+        process, progress = encode_mp3(file_path, encode_file, audio_filter, ffmpeg)
+        if (not encode_succeeded(process, progress) and encode_file != output_file
+                and os.strerror(errno.ENOSPC) in process.stderr):
+            # The free-space check is per file, but every worker shares the staging space,
+            # so several can pass it together and then run out: redo this one on disk.
+            # Any other failure (a corrupt source) is reported as is, not retried
+            if os.path.exists(encode_file):
+                os.remove(encode_file)
+            encode_file = output_file
+            process, progress = encode_mp3(file_path, encode_file, audio_filter, ffmpeg)
         
-        if process.returncode == 0:
-            print(f"   ✅ Successfully normalized: {os.path.basename(output_file)}", flush=True)
-            return {"status": "success", "file": file_path}
+        if encode_succeeded(process, progress):
+            if encode_file != output_file:
+                # Unlink first so a hard-linked older output isn't overwritten in place;
+                # shutil.move copies when the staging dir is on another filesystem
+                if os.path.lexists(output_file):
+                    os.remove(output_file)
+                shutil.move(encode_file, output_file)
+            # out_time_ms is in microseconds despite the name, and "N/A" for some streams
+            encoded = progress.get("out_time_ms", "")
+            duration = f" ({format_duration(int(encoded) / 1_000_000)})" if encoded.isdigit() else ""
+            if on_target:
+                print(f"   ⏭️ Already at {measured['input_i']} LUFS, transcoded without loudnorm: "
+                      f"{output_name}{duration}", flush=True)
+            else:
+                if measured:
+                    print(f"   📊 Input: {measured['input_i']} LUFS → Target: {TARGET_LUFS} LUFS", flush=True)
+                print(f"   ✅ Successfully normalized: {output_name}{duration}", flush=True)
+            return {"status": "success", "file": file_path, "output": output_file, "measured": measured}
         else:
-            return {"status": "failed", "file": file_path, "error": f"Exit code: {process.returncode}"}
+            # With -loglevel error, the last stderr line is ffmpeg's reason for giving up
+            reason = process.stderr.strip().splitlines()[-1:] or [f"Exit code: {process.returncode}"]
+            return {"status": "failed", "file": file_path, "error": reason[0], "measured": measured}
             
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed the stuck ffmpeg
+        return {"status": "failed", "file": file_path, "error": f"Timed out after {NORMALIZE_TIMEOUT}s"}
     except Exception as e:
         return {"status": "failed", "file": file_path, "error": str(e)}
+    finally:
+        # Don't leave a partial encode behind in RAM
+        if encode_file and encode_file != output_file and os.path.exists(encode_file):
+            os.remove(encode_file)
 
-def update_metadata_with_beets(music_directory):
+def update_metadata_with_beets(music_files, log_file):
     """
     Update metadata and fetch cover art using beets.
+    Only the given files are imported, not the whole output tree: beets would
+    rescan the entire library each run, and its incremental mode skips an
+    already-imported directory even when new tracks land in it.
+    beets' output goes straight to log_file; the interesting lines are shown
+    once it has finished.
     """
     print(f"🎨 Updating metadata and fetching cover art...", flush=True)
     
     try:
         # Import files to beets and update metadata
-        command = ["beet", "import", "-A", "-q", music_directory]
-        
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
-                                 universal_newlines=True, bufsize=0)
+        command = ["beet", "import", "-A", "-q", *music_files]
         
-        import_successful = False
-        for line in process.stdout:
-            line = line.rstrip()
-            if line:
-                if "tagging" in line.lower() or "found" in line.lower():
-                    print(f"   📋 {line}", flush=True)
-                elif "fetching" in line.lower() or "art" in line.lower():
-                    print(f"   🖼️ {line}", flush=True)
-                elif "error" in line.lower():
-                    print(f"   ⚠️ {line}", flush=True)
-                else:
-                    # Show other important messages
-                    if any(keyword in line.lower() for keyword in ["album", "track", "match"]):
-                        print(f"   {line}", flush=True)
+        # beets writes to the file itself: no pipe to drain, no per-line work in Python
+        with open(log_file, 'wb') as f:
+            process = subprocess.run(command, stdout=f, stderr=subprocess.STDOUT)
         
-        process.wait()
+        with open(log_file, 'r', errors='replace') as f:
+            output = f.read()
+        # One scan over the whole log picks out the lines worth showing
+        for match in BEETS_LINES_RE.finditer(output):
+            line = match.group().rstrip()
+            for pattern, prefix in BEETS_LINE_STYLES:
+                if pattern.search(line):
+                    print(f"   {prefix}{line}", flush=True)
+                    break
         
         if process.returncode == 0:
             print(f"   ✅ Metadata and cover art processing completed", flush=True)
@@ -161,74 +587,305 @@ def update_metadata_with_beets(music_directory):
         print(f"   ❌ Beets processing failed: {e}", flush=True)
         return False
 
-def process_music(directory):
+def iter_audio_files(directory):
     """
-    Processes music in the given directory by finding all audio files,
-    running the normalize.sh script on them, and reporting any failures.
+    Yield paths of supported audio files anywhere under directory.
     """
-    print(f"Starting to process and normalize music in: {directory}", flush=True)
+    # Explicit stack rather than recursion: no nested generators, no depth limit
+    pending = [directory]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            # Missing or unreadable: skip it silently, as os.walk() did
+            continue
+        with entries:
+            for entry in entries:
+                # Test the name first: it's free, while is_file()/is_dir() may need a stat()
+                # on filesystems that don't report the entry type from getdents
+                if os.path.splitext(entry.name)[1].lower() in SUPPORTED_EXTENSIONS and entry.is_file():
+                    yield entry.path
+                elif entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    normalize_script_path = os.path.join(script_dir, "normalize.sh")
+def track_duration(file_path):
+    """
+    Track length in seconds from the file headers, estimated from the file size
+    when mutagen is missing or can't parse the file.
+    """
+    if mutagen is not None:
+        try:
+            audio = mutagen.File(file_path)
+            if audio is not None and audio.info.length:
+                return audio.info.length
+        except Exception:
+            pass
+    try:
+        return os.path.getsize(file_path) / FALLBACK_BYTES_PER_SECOND
+    except OSError:
+        return 0
 
-    if not os.access(normalize_script_path, os.X_OK):
-        print(f"[ERROR] Normalize script not found or not executable at: {normalize_script_path}", flush=True)
-        return
+def longest_first(paths):
+    """
+    Order paths by descending duration so long tracks start early and short
+    ones fill the tail, instead of a long track leaving the other workers idle.
+    """
+    return sorted(paths, key=track_duration, reverse=True)
 
-    audio_files = []
-    supported_extensions = ['.flac', '.mp3', '.ogg', '.wav', '.aiff']
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in supported_extensions):
-                audio_files.append(os.path.join(root, file))
+def watch_downloads(directory, done, interval=WATCH_INTERVAL):
+    """
+    Yield audio files as they show up in directory until done is set, each
+    scan's batch longest-first.
+    sldl writes in-progress downloads under a temporary extension, so only
+    finished tracks should match SUPPORTED_EXTENSIONS; as a safety net a file
+    is only handed out once its size is unchanged between two scans.
+    """
+    seen = set()
+    sizes = {}
+    while True:
+        # Check before scanning so files finished right before the event still get picked up
+        finished = done.is_set()
+        ready = []
+        for path in iter_audio_files(directory):
+            if path in seen:
+                continue
+            # Once sldl has exited nothing is still being written: hand out everything left
+            if finished:
+                ready.append(path)
+                continue
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                # sldl may be renaming or replacing it under us; it shows up again next scan
+                continue
+            if sizes.get(path) == size:
+                ready.append(path)
+            else:
+                sizes[path] = size
+        for path in longest_first(ready):
+            seen.add(path)
+            sizes.pop(path, None)
+            yield path
+        if finished:
+            return
+        done.wait(interval)
+
+def remove_tree(directory):
+    """
+    Delete directory and everything under it. Files are unlinked from a thread
+    pool (unlink releases the GIL, so the filesystem sees them concurrently),
+    then the emptied directories are removed bottom-up.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    files = []
+    dirs = []
+    # Bottom-up walk lists every directory after its children
+    for root, subdirs, names in os.walk(directory, topdown=False):
+        files.extend(os.path.join(root, name) for name in names)
+        # Symlinks to directories are listed as subdirs but must be unlinked, not rmdir'd
+        files.extend(os.path.join(root, name) for name in subdirs
+                     if os.path.islink(os.path.join(root, name)))
+        dirs.append(root)
+
+    with ThreadPoolExecutor(max_workers=CLEANUP_WORKERS) as executor:
+        # list() re-raises the first unlink error
+        list(executor.map(os.unlink, files))
+    for path in dirs:
+        os.rmdir(path)
+
+def is_rotational_disk(path):
+    """
+    Check whether the block device backing path is a spinning disk.
+    Returns False when it can't be determined (tmpfs, overlay, non-Linux).
+    """
+    try:
+        dev = os.stat(path).st_dev
+        sys_dev = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+        # Partitions don't have a queue/ of their own, their parent disk does
+        for candidate in (sys_dev, os.path.join(sys_dev, "..")):
+            rotational = os.path.join(candidate, "queue", "rotational")
+            if os.path.exists(rotational):
+                with open(rotational) as f:
+                    return f.read().strip() == "1"
+    except (OSError, ValueError):
+        pass
+    return False
+
+def default_jobs():
+    """
+    Number of parallel normalize jobs: SOULSLEEK_JOBS if set, else one per CPU.
+    """
+    try:
+        return max(1, int(os.environ.get("SOULSLEEK_JOBS", CPU_COUNT)))
+    except ValueError:
+        return CPU_COUNT
+
+def process_music(directory, jobs=None, audio_files=None, fast=False):
+    """
+    Processes music in the given directory by finding all audio files,
+    normalizing them with ffmpeg, and reporting any failures.
+    audio_files overrides discovery, e.g. with watch_downloads() to consume
+    tracks while they are still being downloaded. fast selects single-pass
+    loudnorm (see normalize_single_file).
+    """
+    from concurrent.futures import ThreadPoolExecutor
 
-    if not audio_files:
-        print("No audio files found to process.", flush=True)
+    print(f"Starting to process and normalize music in: {directory}", flush=True)
+
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        print("[ERROR] ffmpeg not found in PATH", flush=True)
         return
 
     parent_dir = os.path.abspath(os.path.join(directory, os.pardir))
     converted_dir = parent_dir
     os.makedirs(converted_dir, exist_ok=True)
     
-    # Determine number of threads (use half of available cores for stability)
-    max_workers = max(1, multiprocessing.cpu_count() // 2)
-    print(f"Found {len(audio_files)} audio files. Using {max_workers} threads for processing.", flush=True)
+    # One ffmpeg per core; each worker thread just waits on its subprocess
+    max_workers = jobs or default_jobs()
+    print(f"Using {max_workers} threads for processing.", flush=True)
+    if max_workers > 1 and is_rotational_disk(converted_dir):
+        print(f"⚠️ {converted_dir} is on a spinning disk; parallel jobs may be I/O bound. "
+              f"Lower --jobs if processing is slow.", flush=True)
     print(f"Converted files will be saved to: {converted_dir}", flush=True)
 
     successful_conversions = []
+    # Sources whose output from a previous run was still in place and untouched
+    unchanged_files = set()
     failed_conversions = []
+    outputs = {}
+    # A playlist can resolve two entries to the same download; normalize it only once
+    sources = {}
+    duplicates = []
+    # Files that vanished or became unreadable before they could be submitted
+    unreadable = 0
+    loudness_cache = load_loudness_cache(converted_dir)
+    staging_dir = make_staging_dir()
+    started = time.monotonic()
 
-    # Process files in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = []
-        for file_path in audio_files:
-            future = executor.submit(normalize_single_file, file_path, normalize_script_path, converted_dir)
-            futures.append(future)
-        
-        # Collect results
-        for future in futures:
-            result = future.result()
+    futures = {}
+    # Cache key -> (measured, output file or None) for every file finished this run
+    finished = {}
+    # Outputs actually (re)written this run; only these need beets
+    converted_files = set()
+    # Jobs finished so far, for the [n/N] progress line
+    processed = 0
+    results_lock = threading.Lock()
+
+    def record_result(future):
+        # Runs on the worker thread the moment its file is done, so progress and failures
+        # show up live even while the main thread is still waiting on watch_downloads()
+        nonlocal processed
+        result = future.result()
+        with results_lock:
+            processed += 1
+            finished[futures[future]] = (result.get("measured"), result.get("output"))
             if result["status"] == "success":
-                successful_conversions.append(result["file"])
+                outputs[result["file"]] = result["output"]
+                if result.get("unchanged"):
+                    unchanged_files.add(result["file"])
+                else:
+                    successful_conversions.append(result["file"])
+                    converted_files.add(result["output"])
             else:
                 failed_conversions.append({"file": result["file"], "error": result["error"]})
+                print(f"   ❌ Failed: {os.path.basename(result['file'])} ({result['error']})", flush=True)
+            print(f"   [{processed}/{len(futures)}] files processed", flush=True)
+
+    # Process files in parallel
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Submit files as they come in; with watch_downloads() that is while sldl is still running
+            if audio_files is None:
+                audio_files = longest_first(iter_audio_files(directory))
+            for file_path in audio_files:
+                try:
+                    fingerprint = content_fingerprint(file_path)
+                except OSError:
+                    fingerprint = None
+                if fingerprint in sources:
+                    duplicates.append((file_path, sources[fingerprint]))
+                    continue
+                if fingerprint:
+                    sources[fingerprint] = file_path
+                try:
+                    key = loudness_cache_key(file_path)
+                except OSError as e:
+                    # Gone or unreadable since it was found; report it with the rest
+                    with results_lock:
+                        failed_conversions.append({"file": file_path, "error": str(e)})
+                    print(f"   ❌ Failed: {os.path.basename(file_path)} ({e})", flush=True)
+                    unreadable += 1
+                    continue
+                with results_lock:
+                    future = executor.submit(normalize_single_file, file_path, converted_dir, ffmpeg,
+                                             loudness_cache.get(key), fast, staging_dir)
+                    futures[future] = key
+                future.add_done_callback(record_result)
+            if not futures and not unreadable:
+                print("No audio files found to process.", flush=True)
+                return
+            print(f"Found {len(futures) + len(duplicates) + unreadable} audio files.", flush=True)
+            # Leaving the with-block waits for the remaining jobs (and their callbacks)
+    finally:
+        # Every job is done (or was never started); the RAM scratch space can go
+        if staging_dir:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    # Give duplicates their own name by linking the already-normalized copy
+    linked_duplicates = 0
+    for file_path, original in duplicates:
+        if original not in outputs:
+            continue
+        output_file = converted_path(file_path, converted_dir)
+        # Linked on an earlier run and the original hasn't changed since: nothing to redo
+        if original in unchanged_files and os.path.exists(output_file):
+            linked_duplicates += 1
+            continue
+        try:
+            if output_file != outputs[original]:
+                fast_place(outputs[original], output_file)
+                converted_files.add(output_file)
+            linked_duplicates += 1
+        except OSError as e:
+            print(f"⚠️ Could not link duplicate {os.path.basename(file_path)}: {e}", flush=True)
 
     print("\n--- PROCESSING REPORT ---", flush=True)
-    print(f"Successfully converted {len(successful_conversions)} files.", flush=True)
+    print(f"Successfully converted {len(successful_conversions)} files "
+          f"in {time.monotonic() - started:.1f}s.", flush=True)
+    if unchanged_files:
+        print(f"Skipped {len(unchanged_files)} files unchanged since the last run.", flush=True)
+    if duplicates:
+        print(f"Skipped {len(duplicates)} duplicate downloads ({linked_duplicates} linked to their normalized copy).", flush=True)
     
     if failed_conversions:
         print(f"Failed to convert {len(failed_conversions)} files:", flush=True)
         for failed in failed_conversions:
-            print(f"  - File: {os.path.basename(failed['file'])}", flush=True)
+            print(f"  - File: {os.path.basename(failed['file'])} ({failed['error']})", flush=True)
     
-    # Update metadata and fetch cover art with beets (only if conversions were successful)
-    if successful_conversions:
+    # Update metadata and fetch cover art with beets (only for files written this run)
+    if converted_files:
         print(f"\n🎨 Starting metadata and cover art processing...", flush=True)
-        update_metadata_with_beets(converted_dir)
+        update_metadata_with_beets(sorted(converted_files),
+                                   os.path.join(converted_dir, "beets_log.txt"))
+    
+    # Remember outputs as they are after beets has written its tags, so an
+    # identical re-download next run is recognized as already done
+    for key, (measured, output_file) in finished.items():
+        entry = {"measured": measured}
+        try:
+            if output_file:
+                stat = os.stat(output_file)
+                entry["output"] = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            pass
+        loudness_cache[key] = entry
+    save_loudness_cache(converted_dir, loudness_cache)
     
     # Clean up downloads folder after processing
     try:
-        shutil.rmtree(directory)
+        remove_tree(directory)
         print(f"✅ Cleaned up downloads folder: {directory}", flush=True)
     except Exception as e:
         print(f"⚠️ Could not remove downloads folder: {e}", flush=True)
@@ -237,11 +894,14 @@ def process_music(directory):
 
 
 def main():
+    import argparse
+
     parser = argparse.ArgumentParser(description="Soulsleek Downloader and Processor")
     
     # Group for download functionality
     download_group = parser.add_argument_group('Download and Process')
-    download_group.add_argument("--playlist-url", help="Spotify playlist URL")
+    download_group.add_argument("--playlist-url", action="append",
+                                help="Spotify playlist URL (repeat to download several playlists in one run)")
     download_group.add_argument("--output-dir", help="Output directory for music")
     download_group.add_argument("--user", help="Soulseek username")
     download_group.add_argument("--pass", help="Soulseek password")
@@ -250,14 +910,23 @@ def main():
     # Group for local processing functionality
     process_group = parser.add_argument_group('Process Local Folder')
     process_group.add_argument("--process-dir", help="Path to a local directory to process")
+    process_group.add_argument("--jobs", type=int,
+                               help="Number of files to normalize in parallel "
+                                    "(default: $SOULSLEEK_JOBS or one per CPU)")
+    process_group.add_argument("--fast", action="store_true",
+                               help="Single-pass loudness normalization: about twice as fast, "
+                                    "within ~0.5 LU of the target for most tracks")
 
     args = parser.parse_args()
 
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1.")
+
     if args.process_dir:
         if args.playlist_url or args.user or getattr(args, 'pass') or args.pref_format:
             parser.error("--process-dir cannot be used with download arguments.")
         print(f"Processing local directory: {args.process_dir}", flush=True)
-        process_music(args.process_dir)
+        process_music(args.process_dir, args.jobs, fast=args.fast)
 
     elif args.playlist_url:
         if not all([args.output_dir, args.user, getattr(args, 'pass'), args.pref_format]):
@@ -268,17 +937,27 @@ def main():
         
         log_file = os.path.join(args.output_dir, "download_log.txt")
 
-        download_success, failed_tracks = download_music(
-            args.playlist_url,
-            download_dir,
-            log_file,
-            args.user,
-            getattr(args, 'pass'),
-            args.pref_format
-        )
-        
-        if download_success or os.listdir(download_dir):  # Process if download succeeded or files exist
-            process_music(download_dir)
+        # Download in the background and normalize tracks as soon as sldl finishes them,
+        # so CPU and network work overlap instead of running back to back
+        download_done = threading.Event()
+
+        def run_download():
+            try:
+                download_music(
+                    args.playlist_url,
+                    download_dir,
+                    log_file,
+                    args.user,
+                    getattr(args, 'pass'),
+                    args.pref_format
+                )
+            finally:
+                download_done.set()
+
+        downloader = threading.Thread(target=run_download, name="sldl")
+        downloader.start()
+        process_music(download_dir, args.jobs, watch_downloads(download_dir, download_done), args.fast)
+        downloader.join()
     
     else:
         parser.error("You must specify either --playlist-url for downloading or --process-dir for local processing.")